@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+import sys
+from cachepolicy import is_fresh
+from settings import get_setting
+
+caches = [] # Every cache created, for reporting
+
+def _size(value):
+	"""Approximate memory used by value, following lists, tuples, and dictionaries"""
+	size = sys.getsizeof(value)
+	if isinstance(value, (list, tuple)):
+		size += sum(map(_size, value))
+	elif isinstance(value, dict):
+		size += sum(_size(k) + _size(v) for k, v in value.items())
+	return size
+
+
+class Cache:
+	"""Thread safe cache holding at most CACHE_MAX_ENTRIES entries and about CACHE_MAX_MB megabytes.
+	Entries expire according to cachepolicy for data_type, and the least recently used entries are evicted first when full."""
+
+	def __init__(self, name, data_type="quotes"):
+		self.name = name
+		self.data_type = data_type
+		self._entries = OrderedDict() # key -> (timestamp, size, value), least recently used first
+		self._bytes = 0
+		self._lock = Lock()
+		self.hits = self.misses = self.evictions = self.expirations = 0
+		caches.append(self)
+
+	def get(self, key):
+		"""Returns the value for key if present and fresh, otherwise None"""
+		with self._lock:
+			if key not in self._entries:
+				self.misses += 1
+				return None
+			(timestamp, size, value) = self._entries[key]
+			if not is_fresh(timestamp, self.data_type):
+				self._remove(key)
+				self.expirations += 1
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return value
+
+	def peek(self, key):
+		"""Returns the value for key whether fresh or not, or None, without counting it as a use"""
+		with self._lock:
+			entry = self._entries.get(key)
+			return entry[2] if entry else None
+
+	def put(self, key, value):
+		with self._lock:
+			if key in self._entries:
+				self._remove(key)
+			size = _size(value)
+			self._entries[key] = (datetime.now(), size, value)
+			self._bytes += size
+			self._shrink()
+
+	def items(self):
+		"""Returns [(key, value)] for all entries, whether fresh or not"""
+		with self._lock:
+			return [ (key, entry[2]) for key, entry in self._entries.items() ]
+
+	def invalidate(self, key):
+		with self._lock:
+			if key in self._entries:
+				self._remove(key)
+
+	def invalidate_where(self, predicate):
+		"""Removes every entry whose key matches predicate"""
+		with self._lock:
+			for key in [ key for key in self._entries.keys() if predicate(key) ]:
+				self._remove(key)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self._bytes = 0
+
+	def stats(self):
+		with self._lock:
+			return { "entries" : len(self._entries), "bytes" : self._bytes, "hits" : self.hits, "misses" : self.misses,
+				"evictions" : self.evictions, "expirations" : self.expirations }
+
+	def _remove(self, key):
+		self._bytes -= self._entries.pop(key)[1]
+
+	def _over_limit(self):
+		max_bytes = get_setting("CACHE_MAX_MB") * 1024 * 1024
+		return len(self._entries) > get_setting("CACHE_MAX_ENTRIES") or (max_bytes and self._bytes > max_bytes)
+
+	def _shrink(self):
+		if not self._over_limit():
+			return
+		# Drop expired entries before evicting any that could still be used
+		for key in [ key for key, entry in self._entries.items() if not is_fresh(entry[0], self.data_type) ]:
+			self._remove(key)
+			self.expirations += 1
+		# Never evict the entry just added
+		while len(self._entries) > 1 and self._over_limit():
+			self._remove(next(iter(self._entries)))
+			self.evictions += 1
+
+
+def print_cache_stats():
+	for cache in caches:
+		stats = cache.stats()
+		lookups = stats["hits"] + stats["misses"]
+		print("%s: %d entries (%.1f KB), %d hits, %d misses (%.0f%% hit rate), %d evicted, %d expired" % (cache.name, stats["entries"], stats["bytes"] / 1024,
+			stats["hits"], stats["misses"], stats["hits"] / lookups * 100 if lookups else 0, stats["evictions"], stats["expirations"]))
@@ -0,0 +1,66 @@
+from csv import reader
+from datetime import datetime, time, timedelta
+from os import path
+from zoneinfo import ZoneInfo
+from settings import get_setting
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+
+# Setting holding the lifetime in minutes for each type of cached data
+_ttl_settings = {
+	"quotes" : "DATA_STALE_TIMEOUT",
+	"months" : "MONTHS_STALE_TIMEOUT",
+	"dividends" : "DIVIDEND_STALE_TIMEOUT",
+	}
+
+# Data that can only change while the market is open
+_session_data = ("quotes", "months")
+
+_holidays = set()
+
+def read_holidays(file):
+	"""Reads market holidays from file, one YYYY-MM-DD date per row. Rows starting with # are ignored"""
+	if path.exists(file):
+		with open(file, "r", newline='') as f:
+			for row in reader(f):
+				if not row or row[0].startswith("#"):
+					continue
+				_holidays.add(datetime.strptime(row[0].strip(), "%Y-%m-%d").date())
+
+def is_trading_day(day):
+	return day.weekday() < 5 and day not in _holidays
+
+def market_open(moment):
+	"""Returns true if the market is in session at moment"""
+	moment = moment.astimezone(MARKET_TIMEZONE)
+	return is_trading_day(moment.date()) and MARKET_OPEN <= moment.time() < MARKET_CLOSE
+
+def next_open(moment):
+	"""Returns the start of the first session opening after moment"""
+	moment = moment.astimezone(MARKET_TIMEZONE)
+	day = moment.date()
+	if moment.time() >= MARKET_OPEN:
+		day += timedelta(days=1)
+	while not is_trading_day(day):
+		day += timedelta(days=1)
+	return datetime.combine(day, MARKET_OPEN, MARKET_TIMEZONE)
+
+def is_fresh(timestamp, data_type="quotes", now=None):
+	"""Returns true if data of data_type fetched at timestamp (naive local time, or aware) may still be used.
+	Data is fresh for its TTL setting. Quotes and months fetched while the market is closed stay fresh until the next session opens,
+	dividends never outlive the day they were fetched."""
+	if now is None:
+		now = datetime.now(MARKET_TIMEZONE)
+
+	# The dividend list is picked by ex-date, so it is out of date once the date changes
+	if data_type == "dividends" and timestamp.astimezone().date() != now.astimezone().date():
+		return False
+
+	timestamp = timestamp.astimezone(MARKET_TIMEZONE)
+	if (now - timestamp).total_seconds() / 60 < get_setting(_ttl_settings[data_type]):
+		return True
+
+	# Nothing can have changed since a fetch outside of market hours until the market opens again
+	return data_type in _session_data and not market_open(timestamp) and now < next_open(timestamp)
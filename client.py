@@ -0,0 +1,32 @@
+import socket
+import sys
+
+# Kept free of heavy imports so that forwarding a command is cheap
+SOCKET_PATH = "data/server.sock"
+BUFFER_SIZE = 65536
+
+def send_command(cmd, socket_path=SOCKET_PATH):
+	"""Sends a single command to a running server and returns its output as a string"""
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+		s.connect(socket_path)
+		s.sendall((cmd.replace("\n", " ") + "\n").encode())
+		s.shutdown(socket.SHUT_WR)
+		chunks = []
+		while True:
+			chunk = s.recv(BUFFER_SIZE)
+			if not chunk:
+				break
+			chunks.append(chunk)
+	return b"".join(chunks).decode()
+
+
+if __name__ == "__main__":
+	if len(sys.argv) < 2:
+		print("Usage: python client.py COMMAND [ARGS]")
+		sys.exit(2)
+
+	try:
+		sys.stdout.write(send_command(" ".join(sys.argv[1:])))
+	except (FileNotFoundError, ConnectionRefusedError):
+		print("Server is not running. Start it with 'python server.py'")
+		sys.exit(1)
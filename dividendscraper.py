@@ -3,6 +3,7 @@ import js2py
 import requests
 import re
 from settings import get_setting
+from cache import Cache
 from decimal import Decimal
 from datetime import datetime
 from pprint import pprint
@@ -16,7 +17,8 @@ class Document(object):
         self.value += ''.join(str(i) for i in args)
 		
 
-_dividend_cache = tuple()
+_dividend_cache = Cache("dividends", "dividends")
+_session = requests.Session() # Reuse connections across requests
 
 # Necessary variables for JS evaluation
 variables = """var TTI_fontFace        = 'Arial';      // The font face to use in the table
@@ -44,16 +46,16 @@ def get_dividends():
 	Gets tickers with dividends that end trading today (i.e. ex-dividend date tomorrow)
 	Return value is a sorted (high->low by percent) of [symbol, name, type: {Q/M/A/S}, dividend, current price, return, ex-date (datetime), payment date (string)]
 	"""
-	global _dividend_cache
-	if _dividend_cache and (datetime.now() - _dividend_cache[0]).total_seconds() / 60 < get_setting("DATA_STALE_TIMEOUT"):
-		return _dividend_cache[1]
+	dividends = _dividend_cache.get("dividends")
+	if dividends is not None:
+		return dividends
 	
 	target = "https://secure.tickertech.com/bnkinvest/custom.js"
 
 	document = Document()
 
 	# Request
-	response = requests.get(target)
+	response = _session.get(target, timeout=get_setting("REQUEST_TIMEOUT"))
 	js = response.text
 	location = ""
 
@@ -87,6 +89,9 @@ def get_dividends():
 
 	dividends.sort(key=lambda x: x[5], reverse=True)
 	
-	_dividend_cache = (datetime.now(), dividends)
+	_dividend_cache.put("dividends", dividends)
 
 	return dividends
+
+def invalidate_dividends():
+	_dividend_cache.clear()
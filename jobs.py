@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+
+class JobCancelled(Exception):
+	"""Raised inside a job's thread once the job has been cancelled"""
+	pass
+
+
+class Job:
+
+	def __init__(self, id, cmd):
+		self.id = id
+		self.cmd = cmd
+		self.status = "running"
+		self.progress = ""
+		self.started = time.time()
+		self.cancelled = threading.Event()
+		self.task = None
+
+	def describe(self):
+		elapsed = time.time() - self.started
+		progress = " (%s)" % self.progress if self.progress and self.status == "running" else ""
+		return "[%d] %-9s %5.0fs  %s%s" % (self.id, self.status, elapsed, self.cmd, progress)
+
+
+_local = threading.local() # Holds the job run by the current thread, if any
+jobs = dict() # id -> Job, for every job started in this session
+_next_id = 1
+
+def current_job():
+	return getattr(_local, "job", None)
+
+def check_cancelled():
+	"""Raises JobCancelled if the calling thread runs a job that has been cancelled. Does nothing outside of jobs."""
+	job = current_job()
+	if job and job.cancelled.is_set():
+		raise JobCancelled()
+
+def report_progress(done, total, action="done"):
+	"""Records progress for the job run by the calling thread, shown by the jobs command"""
+	job = current_job()
+	if job:
+		job.progress = "%s %d/%d" % (action, done, total)
+
+def wait(seconds):
+	"""Sleeps for seconds, waking up early with JobCancelled if the calling thread's job is cancelled"""
+	job = current_job()
+	if job:
+		job.cancelled.wait(seconds)
+		check_cancelled()
+	else:
+		time.sleep(seconds)
+
+def cancel(ids=None):
+	"""Cancels the running jobs with the given ids, or all running jobs if none are given"""
+	for job in jobs.values():
+		if job.status == "running" and (ids is None or job.id in ids):
+			job.cancelled.set()
+			job.status = "cancelling"
+
+def print_jobs():
+	if not jobs:
+		print("No jobs")
+	for job in jobs.values():
+		print(job.describe())
+
+def _run_job(job, parse, cmd):
+	_local.job = job
+	try:
+		parse(cmd)
+		job.status = "done"
+	except JobCancelled:
+		job.status = "cancelled"
+	except Exception as e:
+		print("[%d] Error running '%s': %s" % (job.id, cmd, e))
+		job.status = "failed"
+	finally:
+		_local.job = None
+
+def start_job(parse, cmd):
+	"""Runs parse(cmd) in a background thread. Must be called from the event loop."""
+	global _next_id
+	job = Job(_next_id, cmd)
+	_next_id += 1
+	jobs[job.id] = job
+	job.task = asyncio.ensure_future(asyncio.to_thread(_run_job, job, parse, cmd))
+	job.task.add_done_callback(lambda task: print("\n[%d] %s: %s" % (job.id, job.status, job.cmd)))
+	print("[%d] %s" % (job.id, cmd))
+	return job
+
+def _read_input(loop, queue, ready, prompt):
+	# Runs in a daemon thread so a blocked input() never keeps the process alive
+	while True:
+		# Only prompt again once the previous command has been handled
+		ready.wait()
+		ready.clear()
+		try:
+			line = input(prompt)
+		except EOFError:
+			line = "exit"
+		loop.call_soon_threadsafe(queue.put_nowait, line)
+		if line == "exit" or line == "quit":
+			return
+
+async def repl(parse, background, prompt="opt>"):
+	"""Reads commands until exit or quit. Commands for which background(cmd) is true run as jobs,
+	everything else runs immediately, so quick commands keep working while jobs run.
+	Running jobs are cancelled, and waited for, before returning."""
+	loop = asyncio.get_running_loop()
+	queue = asyncio.Queue()
+	ready = threading.Event()
+	ready.set()
+	threading.Thread(target=_read_input, args=(loop, queue, ready, prompt), daemon=True).start()
+
+	try:
+		while True:
+			cmd = (await queue.get()).strip()
+			if cmd == "exit" or cmd == "quit":
+				print("quitting...")
+				break
+			elif cmd == "jobs":
+				print_jobs()
+			elif cmd == "cancel" or cmd.startswith("cancel "):
+				args = cmd[6:].replace(",", " ").split()
+				if not args:
+					cancel()
+				else:
+					# Only cancel the jobs named, a typo must not stop everything
+					ids = [ int(s) for s in args if s.isdigit() and int(s) in jobs ]
+					for s in args:
+						if not s.isdigit() or int(s) not in jobs:
+							print("No job %s" % s)
+					cancel(ids)
+			elif cmd and background(cmd):
+				start_job(parse, cmd)
+			elif cmd:
+				parse(cmd)
+			ready.set()
+	finally:
+		# Also reached on Ctrl-C, so in-flight work stops cleanly before data is saved
+		cancel()
+		running = [ job.task for job in jobs.values() if not job.task.done() ]
+		if running:
+			print("Waiting for %d job(s) to stop..." % len(running))
+			await asyncio.gather(*running, return_exceptions=True)
@@ -1,13 +1,24 @@
-from scraper import get_header, get_contracts, update_months, get_daily_watchlist
+from scraper import cached_header, get_contracts, update_months, get_daily_watchlist, month_timestamps, cached_chains, invalidate_contracts
+from scraper import NoChainError, FETCH_ERRORS, is_transient
+from cachepolicy import is_fresh, read_holidays
 from optionparser import *
-from dividendscraper import get_dividends
+from dividendscraper import get_dividends, invalidate_dividends
+from cache import print_cache_stats
+from output import OutputWriter, ThreadOutput, format_option, format_spread
+from jobs import JobCancelled, current_job, check_cancelled, report_progress, wait, repl
+from sweep import SWEEP_SETTINGS, parse_values, sweep, print_sweep
 from settings import get_setting, set_setting, read_settings, save_settings, print_settings, is_setting
 from csv import reader, writer
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
 from enum import Flag, auto
+from hashlib import sha1
+from decimal import Decimal
 import re
 import sys
 import datetime
 from os import path, makedirs
+import asyncio
+import threading
 
 # TODO: Calendar support
 
@@ -19,21 +30,44 @@ symbol_month = dict()
 month_csv_modified = False
 symbol_csv_modified = False
 setting_csv_modified = False
+state_lock = threading.RLock() # Guards symbol_month and lists, which jobs and the prompt change concurrently
+_script_state = threading.local() # defer_save is set for the thread running a script, so only its changes are written once at the end
+allow_unbounded = True # Cleared by the server, which cannot interrupt commands that never return (watch)
 
 DATA_DIR = "data/"
 MONTHS_CSV = DATA_DIR + "months.csv"
+MONTH_TIMES_CSV = DATA_DIR + "month_times.csv"
+HOLIDAYS_CSV = DATA_DIR + "holidays.csv"
 SYMBOL_CSV = DATA_DIR + "symbols.csv"
 SETTINGS_CSV = DATA_DIR + "settings.csv"
 
 pattern = re.compile("\s+|\s*,\s*")
+_output_options = re.compile(r"\s+--(output|format)\s+(\S+)")
 
-today = datetime.date.today()
+# Report output for the command currently being parsed by each thread
+_default_output = OutputWriter()
+output = ThreadOutput(_default_output)
 
 class Mode(Flag):
 	SPREADS = auto()
 	OPTIONS = auto()
 	CALENDAR = auto()
 
+_fetch_commands = { "spreads" : Mode.SPREADS,
+	"options" : Mode.OPTIONS,
+	"calendar" : Mode.CALENDAR,
+	"fetch" : Mode.SPREADS | Mode.OPTIONS | Mode.CALENDAR }
+
+# Commands run as background jobs in the interactive prompt
+_background_commands = ("refresh", "report", "daily", "dividends", "capture", "watch", "sweep", "script")
+FUTURE_POLL_INTERVAL = 0.1 # Seconds between checks for cancellation while waiting on requests
+
+# Commands after which prefetched data may no longer match what later commands need
+_state_commands = ("refresh", "add", "remove", "create", "delete", "set ")
+
+# Commands that change or print lists, run one at a time under state_lock
+_list_commands = ("add", "remove", "create", "delete", "list")
+
 # LIST MANIPLUATION
 
 def remove_symbols(interest_list, symbols):
@@ -53,42 +87,16 @@ def add_symbols(interest_list, symbols):
 
 # OUTPUT
 
-def print_spreads(type, spreads):
-	type = type.lower()
-	# TODO: Should reverse order for calls
-	for spread in spreads:
-		print("%.2f/%.2f %s: $%.2f/%.1f%% (%d%%; %.1f%% out)" % (spread[0], spread[1], type, spread[4], spread[5] * 100, spread[6], spread[7] * 100))
-	print("") # Newline
-	
-def print_options(type, price, options):
-	type = type.lower()
-	if type == "put":
-		for opt in options:
-			if (opt[0] > price): print("-", end='')
-			print("%.2f %s: %.2f/%.1f%% (%d%%; %.1f%% out) %.2f cost basis if put" % (opt[0], type, opt[1], opt[3], opt[4], opt[5] * 100, opt[6]))
-	elif type == "call":
-		for opt in options:
-			if (opt[0] < price): print("-", end='')
-			print("%.2f %s: %.2f/%.1f%% (%d%%; %.1f%% out) %.1f%% return if called" % (opt[0], type, opt[1], opt[3], opt[4], opt[5] * 100, opt[6] * 100))
-	print("") # Newline
-	
 def print_list(name):
 	if name in lists.keys():
 		print("%s: %s" % (name, ", ".join(lists[name]))) 
 	else:
 		print("%s is not a valid list" % name)
 		
-def print_dividends(dividends):
-	for d in dividends:
-		print("%s (%s): %s %.2f/%.2f (%.2f%%)" % (d[1], d[0], d[2], d[3], d[4], d[5] * 100))
-	print("") # Newline
-
 def print_invalid_error(ticker):
 	err_string = "| %s is not a valid stock ticker |" % ticker.upper()
 	line_string = " " + "-" * (len(err_string) - 2)
-	print(line_string)
-	print(err_string)
-	print(line_string, "\n")
+	output.message("%s\n%s\n%s \n" % (line_string, err_string, line_string))
 
 _help_dictionary = { "help" : "Print available commands",
 	"options [$STOCKS, LISTS]" : ["Fetch and print options for all tickers or lists provided as arguments.", "If no arguments are provided, fetch all lists."],
@@ -96,6 +104,9 @@ _help_dictionary = { "help" : "Print available commands",
 	"calendar [$STOCKS, LISTS]"	: ["Fetch and print calendar spreads for all tickers or lists provided as arguments.", "If no arguments are provided, fetch all lists."],
 	"fetch [$STOCKS, LISTS]" : ["Fetch and print options, spreads, and calendar spreads for all tickers or lists provided as arguments.", "If no arguments are provided, fetch all lists."],
 	"[$STOCKS]" : "Same as fetch [$STOCKS]. The first stock must start with a $",
+	"... --output FILE --format FORMAT" : ["Write the report from options, spreads, fetch, report, and dividends to FILE instead of the screen,", "as text, csv, or jsonl. Defaults to the OUTPUT_FORMAT setting."],
+	"watch [$STOCKS, LISTS] [--interval N]" : ["Refetch the given tickers or lists every N seconds (default 60) and print only options and spreads that are new (+),", "have vanished (-), or whose return changed by more than WATCH_MIN_CHANGE (*). If no arguments are provided, watch all lists. Not available on the server."],
+	"sweep SETTING=VALUES... [$STOCKS, LISTS]" : ["Screen cached contracts for every combination of VALUES (START:STOP[:STEP] or comma separated) and print", "the options and spreads found for each. Works for %s. Makes no requests." % ", ".join(SWEEP_SETTINGS)],
 	"report OR daily" : "Fetch a list of daily selected stocks",
 	"create [LISTS]" : "Create a new list for each of the provided argument, if no list exists. Lists are case-sensitive.",
 	"delete [LISTS]" : "Deletes each provided list, if it exists. Asks for confirmation for non-empty lists.",
@@ -105,10 +116,16 @@ _help_dictionary = { "help" : "Print available commands",
 	"list [LISTS]" : "Print the contents of all lists from LISTS. If no lists are provided, print the contents of all lists.",
 	"list_months [LISTS]" : "Print the front contract month for all tickers in the given lists. If no lists are provided, print all lists.",
 	"dividends" : "List stocks with ex-dividend days tomorrow",
+	"capture [N]" : ["Fetch front month calls for the (first N) stocks from dividends and list covered calls ranked by", "return if called plus dividend yield on the cost of 100 shares"],
+	"cache" : "Print size, hits, misses, evictions, and expirations for each cache",
+	"cache clear [$STOCKS, LISTS]" : "Remove cached contracts for the given tickers or lists. If no arguments are provided, clear all cached data.",
 	"settings" : "List all settings and current values",
 	"set SETTING VALUE" : "Set SETTING to VALUE, if SETTING is a valid setting (i.e. listed under 'settings')",
+	"script FILE" : ["Run the commands in FILE (one per line, - for stdin). Contracts are fetched concurrently and shared between commands,", "and changes are saved once at the end."],
 	"save" : "Save lists, months, and settings to persistent storage. This is done automatically at exit, but save may help in cases where crashes occur.",
-	"exit or quit" : "Exit the program" }
+	"jobs" : ["List background jobs with their status and progress. Long commands (fetches, report, refresh, dividends, watch, sweep, script)", "run in the background so other commands can be used meanwhile."],
+	"cancel [JOBS]" : "Cancel the given background jobs, or all running jobs if none are given",
+	"exit or quit" : "Exit the program. Running jobs are cancelled and data is saved, also on Ctrl-C." }
 
 def print_help():
 	print("Available commands:")
@@ -129,92 +146,560 @@ def print_help():
 
 def save_months():
 	# Store to dictionary on disk
+	with state_lock:
+		months = list(symbol_month.items())
 	with open(MONTHS_CSV, "w", newline='') as f:
 		w = writer(f)
-		for key, val in symbol_month.items():
+		for key, val in months:
 			w.writerow([key] + val)
+	with open(MONTH_TIMES_CSV, "w", newline='') as f:
+		w = writer(f)
+		for key, val in months:
+			if key in month_timestamps:
+				w.writerow([key, month_timestamps[key].isoformat()])
 		
 def save_lists():
 	# Store to dictionary on disk
+	with state_lock:
+		rows = [ [key] + list(val) for key, val in lists.items() ]
 	with open(SYMBOL_CSV, "w", newline='') as f:
 		w = writer(f)
-		for key, val in lists.items():
-			w.writerow([key] + list(val))
+		for row in rows:
+			w.writerow(row)
 
 # SCRAPING METHODS
 
 def fetch_multiple(symbols, instruments, no_lists=False, omit_empty=False):
+	"""Fetches and prints contracts for all symbols and lists. Each symbol is fetched and screened once, 
+	and the results are printed in every section (list) it appears in. Symbols that fail are left out
+	and listed in a summary at the end, they do not stop the others."""
 	global month_csv_modified
-	for symbol in symbols:
-	
+	sections = plan_sections(symbols, no_lists)
+
+	# Look up months once per symbol, then fetch each chain once
+	months = dict()
+	errors = dict() # (symbol, type) -> error, for chains that could not be fetched
+	for (name, section_symbols) in sections:
+		for symbol in section_symbols:
+			if symbol not in months:
+				check_cancelled()
+				try:
+					months[symbol] = front_month(symbol)
+					if not months[symbol]:
+						print_invalid_error(symbol)
+				except FETCH_ERRORS as e:
+					months[symbol] = None
+					errors.update({ (symbol, type) : e for type in _types })
+	failed = fetch_all([ (symbol, month, type) for (symbol, month) in months.items() if month for type in _types ])
+
+	# A month without a chain usually means the months are out of date, so refresh them and try the new front month
+	rescheduled = []
+	for symbol in { target[0] for (target, error) in failed.items() if isinstance(error, NoChainError) }:
+		try:
+			if store_months(symbol, symbol_month):
+				month_csv_modified = True
+				month = front_month(symbol)
+				if month and month != months[symbol]:
+					months[symbol] = month
+					rescheduled.extend([ (symbol, month, type) for type in _types ])
+		except FETCH_ERRORS as e:
+			if get_setting("DEBUG"): print(e)
+	if rescheduled:
+		failed = { target : error for (target, error) in failed.items() if target[0] not in { t[0] for t in rescheduled } }
+		failed.update(fetch_all(rescheduled))
+	errors.update({ (symbol, type) : error for ((symbol, month, type), error) in failed.items() })
+
+	results = dict() # (symbol, type) -> (header, price, filtered options, credit spreads, calendar spreads)
+	total = sum(len(section_symbols) for (name, section_symbols) in sections)
+	done = 0
+	for (name, section_symbols) in sections:
+		output.heading(name)
+
+		for symbol in section_symbols:
+			check_cancelled()
+			report_progress(done, total, "screened")
+			done += 1
+			month = months[symbol]
+			if not month:
+				continue
+
+			for type in _types:
+				if (symbol, type) in errors:
+					continue
+				if (symbol, type) not in results:
+					try:
+						results[(symbol, type)] = screen(symbol, month, type, instruments)
+					except FETCH_ERRORS as e:
+						errors[(symbol, type)] = e
+						continue
+				(header, price, filtered_options, cred_spreads, cal_spreads) = results[(symbol, type)]
+
+				# Only print output if omit_empty is false, or if there is useful output to print
+				if not omit_empty or filtered_options or cred_spreads or cal_spreads:
+					output.section(symbol, month, type, header, price)
+					output.options(type, price, filtered_options)
+					output.spreads(type, cred_spreads)
+
+					if cal_spreads:
+						pass
+					else:
+						pass
+
+	if errors:
+		print_fetch_errors(errors, len(months) * len(_types))
+				
+	if month_csv_modified and not defer_save():
+		save_months()
+
+def dividend_capture(dividends):
+	"""Concurrently fetches front month calls for each stock in dividends (from get_dividends) and prints the covered calls 
+	from filter_options, ranked by return if called plus dividend yield, both on the cost of 100 shares.
+	The premium alone would count an in the money call's intrinsic value as return."""
+	months = dict()
+	errors = dict()
+	for d in dividends:
+		check_cancelled()
+		try:
+			months[d[0]] = front_month(d[0])
+			if not months[d[0]]:
+				print_invalid_error(d[0])
+		except FETCH_ERRORS as e:
+			errors[(d[0], "call")] = e
+	failed = fetch_all([ (symbol, month, "call") for (symbol, month) in months.items() if month ])
+	errors.update({ (symbol, type) : error for ((symbol, month, type), error) in failed.items() })
+
+	# [symbol, name, ex-date, month, price, dividend, strike, bid, odds, return if called, combined return]
+	captures = []
+	for d in dividends:
+		month = months.get(d[0])
+		if not month or (d[0], "call") in errors:
+			continue
+		try:
+			(price, options) = get_contracts(d[0], month, "call")
+		except FETCH_ERRORS as e:
+			errors[(d[0], "call")] = e
+			continue
+		if price >= get_setting("MAX_DIV_SHARE_PRICE"):
+			continue
+		for opt in filter_options("call", price, options):
+			captures.append([d[0], d[1], d[6], month, price, d[3], opt[0], opt[1], opt[4], opt[6], opt[6] + d[3] / price])
+
+	captures.sort(key=lambda c: c[10], reverse=True)
+	output.captures(captures)
+	if errors:
+		print_fetch_errors(errors, len(dividends))
+	if month_csv_modified and not defer_save():
+		save_months()
+
+def plan_sections(symbols_list, no_lists=False):
+	"""Splits symbols_list into sections for output. Each list becomes a (name, [symbols]) section, and consecutive 
+	tickers are grouped into a (None, [symbols]) section. Tickers are uppercased and appear at most once per section."""
+	sections = []
+	for symbol in symbols_list:
 		# Indirect lists
 		if not no_lists and not symbol[0] == "$" and symbol in lists.keys():
-			fetch_multiple(lists[symbol], instruments, True, omit_empty)
+			with state_lock:
+				sections.append((symbol, list(lists[symbol])))
 			continue
-			
-		symbol = symbol.strip("$")
+
+		symbol = symbol.strip("$").upper()
 		if not symbol:
 			continue
+		if not sections or sections[-1][0] is not None:
+			sections.append((None, []))
+		if symbol not in sections[-1][1]:
+			sections[-1][1].append(symbol)
+	return sections
+
+def screen(symbol, month, type, instruments):
+	"""Gets contracts for symbol and filters them according to instruments. 
+	Returns (header, price, filtered options, credit spreads, calendar spreads), with None for instruments not requested"""
+	(price, options) = get_contracts(symbol, month, type)
+	# The chain can only have been evicted since with a tiny cache, fall back to a bare header rather than failing
+	header = cached_header(symbol, month, type) or "(%s)" % symbol
+	filtered_options = cred_spreads = cal_spreads = None
+	
+	if (instruments & Mode.OPTIONS):
+		filtered_options = filter_options(type, price, options)
 	
-		# Get months if absent
-		if symbol not in symbol_month.keys():
-			if update_months(symbol, symbol_month):
+	if (instruments & Mode.SPREADS):
+		cred_spreads = credit_spreads(price, type, options, not get_setting("PRINT_ALL"))
+	
+	if (instruments & Mode.CALENDAR):
+		# Calendar spreads not implemented yet
+		pass
+
+	return (header, price, filtered_options, cred_spreads, cal_spreads)
+
+
+def front_month(symbol):
+	"""Returns the front contract month for symbol that is at least MIN_TIME_DIFFERENCE days away, fetching months if absent. Returns None if the symbol is not valid"""
+	global month_csv_modified
+
+	# Get months if absent (or if none were listed)
+	if not symbol_month.get(symbol):
+		if store_months(symbol, symbol_month):
+			month_csv_modified = True
+		else:
+			return None
+	# Refetch stale months, keeping the old ones if that fails
+	elif symbol in month_timestamps and not is_fresh(month_timestamps[symbol], "months"):
+		try:
+			if store_months(symbol, symbol_month):
 				month_csv_modified = True
-			else:
-				print_invalid_error(symbol)
-				continue
-			
-		# Make sure the date is more than MIN_TIME_DIFFERENCE away
+		except FETCH_ERRORS as e:
+			if get_setting("DEBUG"): print(e)
+		
+	# Make sure the date is more than MIN_TIME_DIFFERENCE away
+	with state_lock:
 		month = symbol_month[symbol][0]
-		while (datetime.datetime.strptime(month, "%Y%m%d").date() - today < datetime.timedelta(get_setting("MIN_TIME_DIFFERENCE"))):
+		while (datetime.datetime.strptime(month, "%Y%m%d").date() - datetime.date.today() < datetime.timedelta(get_setting("MIN_TIME_DIFFERENCE"))):
+			if len(symbol_month[symbol]) < 2:
+				raise NoChainError("No contract months for %s are at least MIN_TIME_DIFFERENCE days away" % symbol)
 			month = symbol_month[symbol][1]
 			symbol_month[symbol] = symbol_month[symbol][1:]
 			month_csv_modified = True
-			
-		for type in _types:
 
-			header = get_header(symbol, month, type)
-			(price, options) = get_contracts(symbol, month, type)
-			filtered_options = cred_spreads = cal_spreads = None
-			
-			if (instruments & Mode.OPTIONS):
-				filtered_options = filter_options(type, price, options)
-			
-			if (instruments & Mode.SPREADS):
-				cred_spreads = credit_spreads(price, type, options, not get_setting("PRINT_ALL"))
-			
-			if (instruments & Mode.CALENDAR):
-				# Calendar spreads not implemented yet
-				pass
-
-			# Only print output if omit_empty is false, or if there is useful output to print
-			if not omit_empty or filtered_options or cred_spreads or cal_spreads:
-				print(header)
-				print("%s %s Contracts" % (month, type.capitalize()))
-				print() # Newline
-
-				if filtered_options:
-					print("--%s options--" % type.capitalize())
-					print_options(type, price, filtered_options)
-				else:
-					print("No %s options\n" % type.capitalize())
-
-				if cred_spreads:
-					print("--%s spreads--" % type.capitalize())
-					print_spreads(type, cred_spreads)
-				else:
-					print("No %s spreads\n" % type.capitalize())
-
-				if cal_spreads:
-					pass
-				else:
-					pass
-				
-	if month_csv_modified:
-		save_months()
+	return month
+
+def store_months(symbol, symbol_month):
+	"""Same as update_months, but stores the months under state_lock so other threads never see symbol_month change while reading it"""
+	fetched = dict()
+	if not update_months(symbol, fetched):
+		return False
+	with state_lock:
+		symbol_month.update(fetched)
+	return True
+
+def expand_symbols(symbols_list, no_lists=False):
+	"""Expands any lists in symbols_list into their symbols. Returns the unique symbols in order, without leading $"""
+	expanded = []
+	for symbol in symbols_list:
+		if not no_lists and not symbol[0] == "$" and symbol in lists.keys():
+			with state_lock:
+				expanded.extend(lists[symbol])
+		elif symbol.strip("$"):
+			expanded.append(symbol.strip("$").upper())
+	return list(dict.fromkeys(expanded))
+
+def fetch_command(cmd):
+	"""Returns (symbols, instruments) if cmd is one of the fetch commands, otherwise None"""
+	for name, instruments in _fetch_commands.items():
+		if cmd.startswith(name):
+			symbols_list = [s for s in pattern.split(cmd[len(name):]) if s.strip("$")]
+			# If no symbols, default to all (split will return [] in this case)
+			if not symbols_list:
+				symbols_list = list(lists.keys())
+			return (symbols_list, instruments)
+	if cmd.startswith("$"): # Assume fetch command if only symbols are given
+		return ([s for s in pattern.split(cmd) if s.strip("$")], Mode.SPREADS | Mode.OPTIONS | Mode.CALENDAR)
+	return None
+
+def prefetch(symbols_list, force=False):
+	"""Concurrently fetches contracts for every symbol so that later commands are served from the cache. 
+	If force is set, contracts are fetched even if cached data is still valid.
+	Returns { (symbol, type) : error } for the chains that could not be fetched."""
+	errors = dict()
+	targets = []
+	for symbol in symbols_list:
+		check_cancelled()
+		try:
+			month = front_month(symbol)
+		except FETCH_ERRORS as e:
+			errors.update({ (symbol, type) : e for type in _types })
+			continue
+		if month:
+			targets.extend([ (symbol, month, type) for type in _types ])
+	failed = fetch_all(targets, force)
+	errors.update({ (symbol, type) : error for ((symbol, month, type), error) in failed.items() })
+	return errors
+
+def fetch_all(targets, force=False):
+	"""Concurrently fetches contracts for each (symbol, month, type) in targets into the cache. Requests that fail with
+	network or server errors are retried up to MAX_RETRIES times, waiting RETRY_BACKOFF seconds and doubling each time.
+	Returns { target : error } for the targets that could not be fetched."""
+	return _retry(targets, lambda pending: _fetch_round(pending, force))
+
+def _retry(targets, fetch_round):
+	"""Calls fetch_round(pending), which returns { target : error } for the pending targets that failed, until every
+	target succeeds or fails for good. Transient errors are retried as described in fetch_all. Returns the final errors."""
+	errors = dict()
+	pending = list(targets)
+	for attempt in range(get_setting("MAX_RETRIES") + 1):
+		if attempt:
+			wait(get_setting("RETRY_BACKOFF") * 2 ** (attempt - 1))
+		failed = fetch_round(pending)
+		for target in pending:
+			if target in failed:
+				errors[target] = failed[target]
+			else:
+				errors.pop(target, None)
+		pending = [ target for (target, error) in failed.items() if is_transient(error) ]
+		if not pending:
+			break
+	return errors
+
+def _fetch_round(targets, force):
+	failed = dict()
+	with ThreadPoolExecutor(max_workers=get_setting("MAX_WORKERS")) as executor:
+		futures = [ (target, executor.submit(get_contracts, *target, force)) for target in targets ]
+		try:
+			for (done, (target, future)) in enumerate(futures):
+				report_progress(done, len(futures), "fetched")
+				while not future.done():
+					check_cancelled()
+					futures_wait([future], FUTURE_POLL_INTERVAL)
+				try:
+					future.result()
+				except FETCH_ERRORS as e:
+					failed[target] = e
+		except JobCancelled:
+			# Drop queued requests, only those already in flight are waited for
+			for (target, future) in futures:
+				future.cancel()
+			raise
+	return failed
+
+def update_all_months(symbols_list, symbol_month):
+	"""Fetches the contract months for each symbol into symbol_month, retrying like fetch_all. Invalid symbols are printed, 
+	and symbols that fail are listed in a summary at the end, they do not stop the others. Returns the symbols that failed."""
+	global month_csv_modified
+	symbols_list = list(symbols_list)
+	errors = _retry(symbols_list, lambda pending: _months_round(pending, symbol_month))
+	if len(errors) < len(symbols_list):
+		month_csv_modified = True
+	if errors:
+		print_fetch_errors({ (symbol, "months") : error for (symbol, error) in errors.items() }, len(symbols_list), "contract months")
+	return list(errors.keys())
+
+def _months_round(symbols_list, symbol_month):
+	failed = dict()
+	for (done, symbol) in enumerate(symbols_list):
+		check_cancelled()
+		report_progress(done, len(symbols_list), "refreshed")
+		try:
+			if not store_months(symbol, symbol_month):
+				print_invalid_error(symbol)
+		except FETCH_ERRORS as e:
+			failed[symbol] = e
+	return failed
+
+def print_fetch_errors(errors, total, what="chains"):
+	"""Prints a summary of the (symbol, type) -> error pairs in errors"""
+	output.message("Could not fetch %d of %d %s:" % (len(errors), total, what))
+	for ((symbol, kind), error) in sorted(errors.items()):
+		output.message(" %s %s: %s" % (symbol, kind, str(error) or type(error).__name__))
+	output.message("")
+
+def watch(symbols_list, interval):
+	"""Refetches contracts for all symbols every interval seconds until interrupted. Options and spreads are only recalculated 
+	for chains whose contents changed, and only new, vanished, or changed opportunities are printed."""
+	chain_hashes = dict() # (symbol, type) -> hash of the last seen chain
+	opportunities = dict() # (symbol, type) -> { strikes : (return, description) }
+	months = dict() # symbol -> month its opportunities were found in
+
+	# In the interactive prompt watch runs as a job, where Ctrl-C quits the program instead
+	stop = "Cancel the job to stop" if current_job() else "Ctrl-C to stop"
+	print("Watching %s every %d seconds. %s." % (", ".join(symbols_list), interval, stop))
+	try:
+		while True:
+			watched = expand_symbols(symbols_list)
+			errors = prefetch(watched, True)
+
+			# Symbols that left the watched lists no longer have opportunities
+			for symbol in [ symbol for symbol in months.keys() if symbol not in watched ]:
+				_drop_watched(symbol, months, chain_hashes, opportunities)
+
+			for symbol in watched:
+				try:
+					month = front_month(symbol)
+				except FETCH_ERRORS:
+					# Keep the last results and try again on the next poll
+					continue
+				# Opportunities from a month that rolled over (or a symbol that is no longer valid) are gone
+				if symbol in months and months[symbol] != month:
+					_drop_watched(symbol, months, chain_hashes, opportunities)
+				if not month:
+					continue
+				months[symbol] = month
+				for type in _types:
+					try:
+						if (symbol, type) in errors:
+							raise errors[(symbol, type)]
+						(price, options) = get_contracts(symbol, month, type)
+					except FETCH_ERRORS as e:
+						# Keep the last results and try again on the next poll
+						print("! %s %s: %s" % (symbol, type, e))
+						continue
+					chain_hash = sha1(repr((month, price, options)).encode()).digest()
+					if chain_hashes.get((symbol, type)) == chain_hash:
+						continue
+					chain_hashes[(symbol, type)] = chain_hash
+
+					current = dict()
+					for opt in filter_options(type, price, options):
+						current[("option", opt[0])] = (opt[6] if type == "call" else opt[3] / 100, format_option(type, price, opt))
+					for spread in credit_spreads(price, type, options, not get_setting("PRINT_ALL")):
+						current[("spread", spread[0], spread[1])] = (spread[5], format_spread(type, spread))
+
+					# Compared against the last reported values, so small moves that add up are still reported
+					previous = opportunities.get((symbol, type), dict())
+					reported = dict()
+					for key, (ret, description) in current.items():
+						if key not in previous:
+							print("+ %s %s" % (symbol, description))
+						elif abs(ret - previous[key][0]) > abs(previous[key][0]) * Decimal(str(get_setting("WATCH_MIN_CHANGE"))):
+							print("* %s %s" % (symbol, description))
+						else:
+							reported[key] = previous[key]
+							continue
+						reported[key] = (ret, description)
+					for key, (ret, description) in previous.items():
+						if key not in current:
+							print("- %s %s" % (symbol, description))
+					opportunities[(symbol, type)] = reported
+
+			if month_csv_modified and not defer_save():
+				save_months()
+			wait(interval)
+	except KeyboardInterrupt:
+		print("Stopped watching")
+
+def _drop_watched(symbol, months, chain_hashes, opportunities):
+	"""Prints every opportunity watch last found for symbol as vanished and forgets the symbol"""
+	del months[symbol]
+	for type in _types:
+		chain_hashes.pop((symbol, type), None)
+		for (ret, description) in opportunities.pop((symbol, type), dict()).values():
+			print("- %s %s" % (symbol, description))
+
+def run_sweep(args):
+	"""Sweeps the SETTING=VALUES arguments in args over cached chains for the remaining tickers and lists (all cached chains if none)"""
+	grid = dict()
+	targets = []
+	for arg in args:
+		if "=" not in arg:
+			targets.append(arg)
+			continue
+		(setting, values) = arg.split("=", 1)
+		setting = setting.upper()
+		if setting not in SWEEP_SETTINGS:
+			print("%s cannot be swept. Use one of %s" % (setting, ", ".join(SWEEP_SETTINGS)))
+			return
+		try:
+			grid[setting] = parse_values(setting, values)
+		except ValueError as e:
+			print("Invalid values for %s: %s" % (setting, e))
+			return
+
+	chains = cached_chains()
+	targets = [ s for s in pattern.split(" ".join(targets)) if s.strip("$") ]
+	if targets:
+		wanted = set(expand_symbols(targets))
+		chains = [ chain for chain in chains if chain[0] in wanted ]
+
+	if not grid:
+		print("No settings to sweep")
+	elif not chains:
+		print("No cached contracts to sweep. Fetch them first.")
+	else:
+		print_sweep([ setting for setting in SWEEP_SETTINGS if setting in grid ], sweep(chains, grid))
+
+def pop_option(args, name, default=None):
+	"""Removes --name VALUE from args and returns VALUE, or default if the option is absent"""
+	option = "--" + name
+	if option in args:
+		index = args.index(option)
+		if index + 1 < len(args):
+			value = args[index + 1]
+			del args[index:index + 2]
+			return value
+		del args[index]
+	return default
+
+def defer_save():
+	"""Returns true if the calling thread is running a script, so changes should be left for the script to save"""
+	return getattr(_script_state, "defer_save", False)
+
+def run_script(commands):
+	"""Runs each command in order. Contracts needed by consecutive fetch commands are fetched once, concurrently, 
+	up to the next command that changes lists, months, or settings. Changes are saved once at the end."""
+	commands = [ c.strip() for c in commands if c.strip() and not c.strip().startswith("#") ]
+
+	# Scripts may run scripts, only the outermost one saves
+	nested = defer_save()
+	_script_state.defer_save = True
+	try:
+		batch = []
+		for cmd in commands:
+			if cmd == "exit" or cmd == "quit":
+				break
+			check_cancelled()
+			batch.append(cmd)
+			if cmd.startswith(_state_commands):
+				_run_batch(batch)
+				batch = []
+		_run_batch(batch)
+	finally:
+		_script_state.defer_save = nested
+		if not nested:
+			save_modified()
+
+def _run_batch(commands):
+	needed = []
+	for cmd in commands:
+		# --output and --format are not tickers
+		fetch = fetch_command(_output_options.sub("", cmd))
+		if fetch:
+			needed.extend(expand_symbols(fetch[0]))
+	# Chains that fail here are fetched again, and reported, by the commands that need them
+	prefetch(list(dict.fromkeys(needed)))
+
+	for cmd in commands:
+		check_cancelled()
+		parse(cmd)
+
+def read_script(file):
+	"""Reads commands from file, one per line. '-' reads from stdin"""
+	if file == "-":
+		return sys.stdin.readlines()
+	with open(file, "r") as f:
+		return f.readlines()
 
 
 def parse(cmd):
+	"""Runs cmd. Reports go to the file given by --output FILE, in the format given by --format FORMAT (default OUTPUT_FORMAT).
+	Commands run from within another command without these options share its output."""
+	options = dict(_output_options.findall(cmd))
+	cmd = _output_options.sub("", cmd)
+	if not options and output.current() is not _default_output:
+		_run(cmd)
+		return
+
+	try:
+		writer = OutputWriter(options.get("format", get_setting("OUTPUT_FORMAT")), options.get("output"))
+	except (ValueError, OSError) as e:
+		print(e)
+		if options:
+			return
+		writer = OutputWriter() # Bad OUTPUT_FORMAT setting, fall back to text so it can still be changed
+
+	previous = output.current()
+	output.set(writer)
+	try:
+		_run(cmd)
+	finally:
+		output.set(previous)
+		writer.close()
+
+def _run(cmd):
+	if cmd.startswith(_list_commands):
+		with state_lock:
+			_parse(cmd)
+	else:
+		_parse(cmd)
+
+def _parse(cmd):
 	global month_csv_modified
 	global symbol_csv_modified
 	global setting_csv_modified
@@ -223,42 +708,47 @@ def parse(cmd):
 		print("Refreshing contract months...")
 		# Flush symbol_month and only include symbols found in some list 
 		new_symbol_month = dict()
-		for symbol in symbols:
-			# TODO: Add some sort of status indicator for long requests
-			if not update_months(symbol, new_symbol_month):
-				print_invalid_error(symbol)
+		# Keep the old months for symbols that could not be refreshed
+		with state_lock:
+			refreshed = list(symbols)
+		for symbol in update_all_months(refreshed, new_symbol_month):
+			if symbol in symbol_month:
+				new_symbol_month[symbol] = symbol_month[symbol]
 		symbol_month = new_symbol_month
 			
 		month_csv_modified = True
-	elif cmd.startswith("spreads"):
-		symbols_list = [s for s in pattern.split(cmd[7:]) if s.strip("$")]
-		# If no symbols, default to all (split will return [] in this case)
-		if not symbols_list:
-			symbols_list = lists.keys()
-		fetch_multiple(symbols_list, Mode.SPREADS)
-	elif cmd.startswith("options"):
-		symbols_list = [s for s in pattern.split(cmd[7:]) if s.strip("$")]
-		if not symbols_list:
-			symbols_list = lists.keys()
-		fetch_multiple(symbols_list, Mode.OPTIONS)
-	elif cmd.startswith("calendar"):
-		symbols_list = [s for s in pattern.split(cmd[8:]) if s.strip("$")]
-		if not symbols_list:
-			symbols_list = lists.keys()
-		fetch_multiple(symbols_list, Mode.CALENDAR)
-	elif cmd.startswith("fetch"):
-		symbols_list = [s for s in pattern.split(cmd[5:]) if s.strip("$")]
-		if not symbols_list:
-			symbols_list = lists.keys()
-		fetch_multiple(symbols_list, Mode.SPREADS | Mode.OPTIONS | Mode.CALENDAR)
-	elif cmd.startswith("$"): # Assume fetch command if only symbols are given
-		symbols_list = [s for s in pattern.split(cmd) if s.strip("$")]
-		fetch_multiple(symbols_list, Mode.SPREADS | Mode.OPTIONS | Mode.CALENDAR)
+	elif fetch_command(cmd):
+		(symbols_list, instruments) = fetch_command(cmd)
+		fetch_multiple(symbols_list, instruments)
 	elif cmd.strip() == "report" or cmd.strip() == "daily" or cmd.strip() == "daily_report":
 		daily_symbols_list = get_daily_watchlist()
 		if get_setting("DEBUG"):
 			print(daily_symbols_list)
 		fetch_multiple(daily_symbols_list, Mode.SPREADS | Mode.OPTIONS | Mode.CALENDAR, True, True)
+	elif cmd.startswith("watch"):
+		args = [s for s in pattern.split(cmd[5:]) if s.strip("$")]
+		interval = pop_option(args, "interval", "60")
+		if not allow_unbounded:
+			output.message("watch runs until stopped, so it cannot be run on the server. Use main.py instead")
+		elif not interval.isdigit() or int(interval) == 0:
+			print("Interval must be a positive number of seconds")
+		else:
+			watch(args or list(lists.keys()), int(interval))
+	elif cmd.startswith("cache"):
+		args = [s for s in pattern.split(cmd[5:]) if s.strip("$")]
+		if not args:
+			print_cache_stats()
+		elif args[0] == "clear":
+			if args[1:]:
+				invalidate_contracts(expand_symbols(args[1:]))
+			else:
+				invalidate_contracts()
+				invalidate_dividends()
+		else:
+			print("Unknown cache command %s" % args[0])
+	elif cmd.startswith("sweep"):
+		# Split on whitespace only, values may be separated by commas
+		run_sweep(cmd[5:].split())
 	elif cmd.startswith("add"):
 		l = [s for s in pattern.split(cmd[4:]) if s.strip("$")]
 		if not l or l[0] not in lists.keys():
@@ -306,9 +796,18 @@ def parse(cmd):
 						ans = "y"
 					else:
 						print_list(s)
+						if current_job():
+							# The prompt is already reading input, so a job cannot ask
+							print("%s is not empty. Delete it from the prompt instead of a job" % s)
+							ans = "n"
 					# Ask for confirmation
 					while (ans != "n" and ans != "y"):
-						ans = input("%s is is not empty. Are you sure? y/n: " % s).lower()
+						try:
+							ans = input("%s is is not empty. Are you sure? y/n: " % s).lower()
+						except EOFError:
+							# No one to confirm (e.g. running from the server), so keep the list
+							print("n")
+							ans = "n"
 						
 					if ans == "y":
 						del lists[s]
@@ -334,9 +833,15 @@ def parse(cmd):
 	elif cmd.startswith("dividends"):
 		args = [s for s in pattern.split(cmd[9:]) if s]
 		if (args and args[0].isdigit()):
-			print_dividends(get_dividends()[:int(args[0])])
+			output.dividends(get_dividends()[:int(args[0])])
 		else:
-			print_dividends(get_dividends())
+			output.dividends(get_dividends())
+	elif cmd.startswith("capture"):
+		args = [s for s in pattern.split(cmd[7:]) if s]
+		dividends = get_dividends()
+		if (args and args[0].isdigit()):
+			dividends = dividends[:int(args[0])]
+		dividend_capture(dividends)
 	elif cmd.strip() == "settings":
 		print_settings()
 	elif cmd.startswith("set "):
@@ -345,9 +850,20 @@ def parse(cmd):
 			print("Requires both key and value")
 		elif is_setting(args[0]):
 			set_setting(args[0], args[1])
-			save_settings(SETTINGS_CSV) # Save immediately, we don't want to risk a crash erasing settings
+			if defer_save():
+				setting_csv_modified = True
+			else:
+				save_settings(SETTINGS_CSV) # Save immediately, we don't want to risk a crash erasing settings
 		else:
 			print("%s is not a valid setting" % args[0])
+	elif cmd.startswith("script"):
+		args = [s for s in pattern.split(cmd[6:]) if s]
+		if not args:
+			print("No script specified")
+		elif not args[0] == "-" and not path.exists(args[0]):
+			print("%s does not exist" % args[0])
+		else:
+			run_script(read_script(args[0]))
 	elif cmd.strip() == "save":
 		save_months()
 		save_lists()
@@ -358,7 +874,14 @@ def parse(cmd):
 		print("Unknown command: " + cmd);
 
 
-if __name__ == "__main__":
+def is_background(cmd):
+	"""Returns true if cmd may take long enough that the interactive prompt should run it as a job"""
+	return cmd.startswith(_background_commands) or bool(fetch_command(cmd))
+
+def load_data():
+	"""Reads settings, lists, and contract months from persistent storage, fetching any missing months"""
+	global month_csv_modified
+
 	# Check for data dir
 	if not path.exists(DATA_DIR):
 		print("Building data dir")
@@ -366,6 +889,7 @@ if __name__ == "__main__":
 		
 		
 	read_settings(SETTINGS_CSV) # Read settings first to get SLOGIN, otherwise getting contract months will fail
+	read_holidays(HOLIDAYS_CSV)
 
 	# Load symbols of interest
 	if path.exists(SYMBOL_CSV):
@@ -381,14 +905,13 @@ if __name__ == "__main__":
 	if not path.exists(MONTHS_CSV):
 		print("Refreshing contract months...")
 		# Fetch the next contract for each symbol
-		for symbol in symbols:
-			if not update_months(symbol, symbol_month):
-				print_invalid_error(symbol)
-				# Remove symbol from lists automatically?
+		update_all_months(symbols, symbol_month)
+		# Remove invalid symbols from lists automatically?
 		# Save immediately
 		save_months()
 	else:
 		# Load from stored dictionary
+		missing = [] # Symbols with no stored months
 		with open(MONTHS_CSV, "r", newline='') as f:
 			r = reader(f)
 			for row in r:
@@ -396,51 +919,70 @@ if __name__ == "__main__":
 					continue # Ignore empty rows, if they exist for some reason
 				if len(row) == 1:
 					# If there are no months, retry getting them
-					if update_months(row[0], symbol_month):
-						month_csv_modified = True
-					else:
-						print_invalid_error(row[0])
+					missing.append(row[0])
 				elif row[0] in symbols: # Only include symbols that are in some list
 					symbol_month[row[0]] = row[1:]
 				else:
 					month_csv_modified = True
+		# Months saved without a fetch time are as old as the file
+		modified = datetime.datetime.fromtimestamp(path.getmtime(MONTHS_CSV))
+		for symbol in symbol_month.keys():
+			month_timestamps.setdefault(symbol, modified)
+		if path.exists(MONTH_TIMES_CSV):
+			with open(MONTH_TIMES_CSV, "r", newline='') as f:
+				for row in reader(f):
+					if len(row) == 2 and row[0] in symbol_month:
+						month_timestamps[row[0]] = datetime.datetime.fromisoformat(row[1])
 		# Refresh any symbols that had no listed contract months
-		for symbol in symbols:
-			if symbol not in symbol_month.keys() or not symbol_month[symbol]:
-				if update_months(symbol, symbol_month):
-					month_csv_modified = True
-				else:
-					print_invalid_error(symbol)
+		missing.extend([ symbol for symbol in symbols if symbol not in symbol_month.keys() or not symbol_month[symbol] ])
+		if missing:
+			update_all_months(list(dict.fromkeys(missing)), symbol_month)
 	
 	if not get_setting("SLOGIN"):
 		print("SLOGIN not set for options. Use 'set SLOGIN xxxxxxxxxx' to set.")
+
+def save_modified():
+	"""Writes lists, months, and settings to persistent storage if they have been modified since the last save"""
+	global month_csv_modified
+	global symbol_csv_modified
+	global setting_csv_modified
+
+	if (month_csv_modified):
+		save_months()
+		month_csv_modified = False
+			
+	if (symbol_csv_modified):
+		save_lists()
+		symbol_csv_modified = False
+	
+	if (setting_csv_modified):
+		save_settings(SETTINGS_CSV)
+		setting_csv_modified = False
+
+
+if __name__ == "__main__":
+	load_data()
 	
 	running = True
 	
 	# Non-interactive mode
-	if len(sys.argv) > 1:
+	if len(sys.argv) > 2 and sys.argv[1] == "--script":
+		run_script(read_script(sys.argv[2]))
+		running = False
+	elif len(sys.argv) > 1:
 		parse(" ".join(sys.argv[1:]))
 		running = False
 		
 	# Main loop
-	while (running):
-		cmd = input("opt>")
-		if cmd == "exit" or cmd == "quit":
-			running = False
+	if running:
+		try:
+			asyncio.run(repl(parse, is_background))
+		except KeyboardInterrupt:
 			print("quitting...")
-		else:
-			parse(cmd)
 		
 
 	# Shutdown procedures
 	
 
 	# Write if modified
-	if (month_csv_modified):
-		save_months()
-			
-	if (symbol_csv_modified):
-		save_lists()
-	
-	if (setting_csv_modified):
-		save_settings(SETTINGS_CSV)
\ No newline at end of file
+	save_modified()
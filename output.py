@@ -0,0 +1,190 @@
+from csv import writer
+from io import StringIO
+import json
+import sys
+import threading
+
+BATCH_SIZE = 1000 # Lines held in memory before they are written out
+
+# Column names for each kind of record in machine-readable formats
+# CSV rows start with the record kind followed by these values, JSON Lines objects use them as keys
+_columns = {
+	"option" : ["list", "symbol", "month", "type", "price", "strike", "bid", "ask", "premium_percent", "odds", "percent_out", "called_return_or_cost_basis"],
+	"spread" : ["list", "symbol", "month", "type", "price", "short_strike", "long_strike", "short_premium", "long_premium", "credit", "return", "odds", "percent_out"],
+	"dividend" : ["symbol", "name", "frequency", "dividend", "price", "return", "ex_date", "pay_date"],
+	"capture" : ["symbol", "name", "ex_date", "month", "price", "dividend", "strike", "bid", "odds", "called_return", "combined_return"],
+	}
+
+def format_spread(type, spread):
+	return "%.2f/%.2f %s: $%.2f/%.1f%% (%d%%; %.1f%% out)" % (spread[0], spread[1], type, spread[4], spread[5] * 100, spread[6], spread[7] * 100)
+
+def format_option(type, price, opt):
+	if type == "put":
+		itm = "-" if opt[0] > price else ""
+		return itm + "%.2f %s: %.2f/%.1f%% (%d%%; %.1f%% out) %.2f cost basis if put" % (opt[0], type, opt[1], opt[3], opt[4], opt[5] * 100, opt[6])
+	else:
+		itm = "-" if opt[0] < price else ""
+		return itm + "%.2f %s: %.2f/%.1f%% (%d%%; %.1f%% out) %.1f%% return if called" % (opt[0], type, opt[1], opt[3], opt[4], opt[5] * 100, opt[6] * 100)
+
+def _dividend_values(d):
+	return [d[0], d[1], d[2], d[3], d[4], d[5], d[6].strftime("%Y-%m-%d"), d[7]]
+
+
+class TextFormatter:
+	"""Human readable output, one line per option, spread, dividend, or dividend capture"""
+	machine_readable = False
+
+	def heading(self, name):
+		if name is None:
+			return []
+		return ["== %s ==" % name, ""]
+
+	def section(self, symbol, month, type, header, price):
+		return [header, "%s %s Contracts" % (month, type.capitalize()), ""]
+
+	def options(self, type, price, options):
+		if not options:
+			return ["No %s options" % type.capitalize(), ""]
+		return ["--%s options--" % type.capitalize()] + [ format_option(type, price, opt) for opt in options ] + [""]
+
+	def spreads(self, type, spreads):
+		# TODO: Should reverse order for calls
+		if not spreads:
+			return ["No %s spreads" % type.capitalize(), ""]
+		return ["--%s spreads--" % type.capitalize()] + [ format_spread(type, spread) for spread in spreads ] + [""]
+
+	def dividends(self, dividends):
+		return [ "%s (%s): %s %.2f/%.2f (%.2f%%)" % (d[1], d[0], d[2], d[3], d[4], d[5] * 100) for d in dividends ] + [""]
+
+	def captures(self, captures):
+		if not captures:
+			return ["No dividend captures", ""]
+		return [ "%s (%s) %s call %.2f/%.2f: %.1f%% return if called + %.2f dividend on %.2f = %.2f%% (%d%%)" % (c[1], c[0], c[3], c[6], c[7], c[9] * 100, c[5], c[4], c[10] * 100, c[8]) for c in captures ] + [""]
+
+
+class RecordFormatter:
+	"""Base for machine readable formats. Produces one record per option, spread, or dividend, see _columns"""
+	machine_readable = True
+
+	def __init__(self):
+		self._list = ""
+		self._section = ("", "", "", "", 0)
+
+	def record(self, kind, values):
+		raise NotImplementedError
+
+	def heading(self, name):
+		# Rows that follow belong to this list, None for tickers given directly
+		self._list = name or ""
+		return []
+
+	def section(self, symbol, month, type, header, price):
+		self._section = (self._list, symbol, month, type, price)
+		return []
+
+	def options(self, type, price, options):
+		return [ self.record("option", list(self._section) + opt) for opt in options or [] ]
+
+	def spreads(self, type, spreads):
+		return [ self.record("spread", list(self._section) + spread) for spread in spreads or [] ]
+
+	def dividends(self, dividends):
+		return [ self.record("dividend", _dividend_values(d)) for d in dividends ]
+
+	def captures(self, captures):
+		return [ self.record("capture", c[:2] + [c[2].strftime("%Y-%m-%d")] + c[3:]) for c in captures ]
+
+
+class CSVFormatter(RecordFormatter):
+
+	def record(self, kind, values):
+		line = StringIO()
+		writer(line).writerow([kind] + values)
+		return line.getvalue().rstrip("\r\n")
+
+
+class JSONLinesFormatter(RecordFormatter):
+
+	def record(self, kind, values):
+		record = { "record" : kind }
+		record.update(zip(_columns[kind], values))
+		return json.dumps(record, default=float)
+
+
+formatters = { "text" : TextFormatter, "csv" : CSVFormatter, "jsonl" : JSONLinesFormatter }
+
+
+class OutputWriter:
+	"""Collects formatted report lines and writes them to stdout or a file in batches.
+	Messages (errors, notices) are written immediately after any pending lines, so ordering is kept.
+	They go to stderr instead when machine readable output is going to stdout."""
+
+	def __init__(self, format="text", file=None, batch_size=BATCH_SIZE):
+		if format not in formatters:
+			raise ValueError("Unknown format %s, must be one of %s" % (format, ", ".join(formatters.keys())))
+		self.formatter = formatters[format]()
+		self._file = open(file, "w", newline='') if file else None
+		self._batch_size = batch_size
+		self._buffer = []
+
+	def _stream(self):
+		# Resolved on every write, so redirected stdout (e.g. in the server) is respected
+		return self._file or sys.stdout
+
+	def _emit(self, lines):
+		self._buffer.extend(lines)
+		if len(self._buffer) >= self._batch_size:
+			self.flush()
+
+	def heading(self, name):
+		self._emit(self.formatter.heading(name))
+
+	def section(self, symbol, month, type, header, price):
+		self._emit(self.formatter.section(symbol, month, type.lower(), header, price))
+
+	def options(self, type, price, options):
+		self._emit(self.formatter.options(type.lower(), price, options))
+
+	def spreads(self, type, spreads):
+		self._emit(self.formatter.spreads(type.lower(), spreads))
+
+	def dividends(self, dividends):
+		self._emit(self.formatter.dividends(dividends))
+
+	def captures(self, captures):
+		self._emit(self.formatter.captures(captures))
+
+	def message(self, text):
+		self.flush()
+		if not self._file and self.formatter.machine_readable:
+			print(text, file=sys.stderr)
+		else:
+			print(text)
+
+	def flush(self):
+		if self._buffer:
+			self._stream().write("\n".join(self._buffer) + "\n")
+			self._buffer = []
+
+	def close(self):
+		self.flush()
+		if self._file:
+			self._file.close()
+			self._file = None
+
+
+class ThreadOutput:
+	"""Forwards to the writer set by the calling thread, or to default, so concurrent commands keep separate output"""
+
+	def __init__(self, default):
+		self._default = default
+		self._local = threading.local()
+
+	def current(self):
+		return getattr(self._local, "writer", self._default)
+
+	def set(self, writer):
+		self._local.writer = writer
+
+	def __getattr__(self, name):
+		return getattr(self.current(), name)
@@ -2,9 +2,25 @@ from HTMLTableParser import HTMLTableParser
 import requests
 import datetime
 from settings import get_setting
+from cache import Cache
 from decimal import Decimal
 
-_ts_data_cache = dict() # Contains a tuple of (timestamp, header, contracts)
+_ts_data_cache = Cache("contracts", "quotes") # Contains a tuple of (header, contracts)
+month_timestamps = dict() # When the contract months for each symbol were last fetched
+_session = requests.Session() # Reuse connections across requests
+
+class ScrapeError(Exception):
+	"""Raised when a page does not contain the expected data"""
+	pass
+
+class NoChainError(ScrapeError):
+	"""Raised when there are no contracts for the requested month, usually because the contract months are out of date"""
+	pass
+
+class LoginRequiredError(ScrapeError):
+	pass
+
+FETCH_ERRORS = (ScrapeError, requests.RequestException) # Errors that affect a single request, not the whole program
 
 contract_urlmask = "https://www.stockoptionschannel.com/symbol/?symbol=%s&month=%s&type=%s"
 watchlist_urlmask = "https://www.stockoptionschannel.com/?rpp=20&start=%d"
@@ -12,54 +28,100 @@ watchlist_urlmask = "https://www.stockoptionschannel.com/?rpp=20&start=%d"
 def get_header(symbol, month, type="call"):
 	"""Gets the header (consisting of symbol, current price, and change) for the given symbol."""
 	
-	# Check first for cached data
-	key = "%s-%s-%s" % (symbol, month, type)
-	if key in _ts_data_cache and (datetime.datetime.now() - _ts_data_cache[key][0]).total_seconds() / 60 < get_setting("DATA_STALE_TIMEOUT"):
-		return _ts_data_cache[key][1]
-
-	# use get_contracts to request data
+	# get_contracts does the one cache lookup, fetching on a miss, so the header is read without counting another
 	get_contracts(symbol, month, type)
-	# data should now be in cache
-	return _ts_data_cache[key][1]
-	
+	return cached_header(symbol, month, type)
+
+def cached_header(symbol, month, type):
+	"""Returns the header of the cached chain whether fresh or not, without counting it as a cache lookup. None if not cached"""
+	entry = _ts_data_cache.peek("%s-%s-%s" % (symbol, month, type))
+	return entry[0] if entry else None
+
+def cached_contracts(symbol, month, type):
+	"""Returns (price, [contracts]) from the cache if fresh, otherwise None"""
+	entry = _ts_data_cache.get("%s-%s-%s" % (symbol, month, type))
+	if entry:
+		return (_header_price(entry[0]), entry[1])
+	return None
+
+def cache_contracts(symbol, month, type, header, contracts):
+	_ts_data_cache.put("%s-%s-%s" % (symbol, month, type), (header, contracts))
+
+def cached_chains():
+	"""Returns [(symbol, month, type, price, [contracts])] for every chain in the cache, whether fresh or not"""
+	chains = []
+	for key, (header, contracts) in _ts_data_cache.items():
+		(symbol, month, type) = key.rsplit("-", 2)
+		chains.append((symbol, month, type, _header_price(header), contracts))
+	return chains
+
+def invalidate_contracts(symbols=None):
+	"""Removes cached contracts for the given symbols, or for all symbols if none are given"""
+	if symbols is None:
+		_ts_data_cache.clear()
+	else:
+		symbols = set(symbols)
+		_ts_data_cache.invalidate_where(lambda key: key.rsplit("-", 2)[0] in symbols)
+
+def _request(target):
+	"""Requests target and returns the page. Raises LoginRequiredError if the page limit was reached, 
+	and requests.HTTPError for responses that are worth retrying."""
+	response = _session.get(target, cookies={'slogin' : get_setting("SLOGIN")}, timeout=get_setting("REQUEST_TIMEOUT"))
+	if response.status_code == 429 or response.status_code >= 500:
+		response.raise_for_status()
+	if "You have viewed 6 pages within the last 6 hours." in response.text:
+		raise LoginRequiredError("Page limit reached, set SLOGIN before continuing")
+	return response.text
+
+def is_transient(error):
+	"""Returns true if the request that raised error may succeed when retried"""
+	return isinstance(error, requests.RequestException)
+
+def _header_price(header):
+	return Decimal(header[header.find("Last:")+6:header.find(" , ")])
 
-def get_contracts(symbol, month, type):
-	"""Gets the contracts for a symbol at a particular month of one type (call or put).
+def get_contracts(symbol, month, type, force=False):
+	"""Gets the contracts for a symbol at a particular month of one type (call or put). If force is set, cached data is ignored.
 	Returns (price, [contracts]) where each contract is [strike, bid, ask, odds]
 	"""
 	target = contract_urlmask % (symbol.strip("$"), month, type)
 		
-	key = "%s-%s-%s" % (symbol, month, type)
-	if key in _ts_data_cache and (datetime.datetime.now() - _ts_data_cache[key][0]).total_seconds() / 60 < get_setting("DATA_STALE_TIMEOUT"):
-		header = _ts_data_cache[key][1]
-		price = Decimal(header[header.find("Last:")+6:header.find(" , ")])
-		return (price, _ts_data_cache[key][2])
+	if not force:
+		cached = cached_contracts(symbol, month, type)
+		if cached:
+			return cached
 	
 	# Request
 	if(get_setting("DEBUG")): print(target)
-	response = requests.get(target, cookies={'slogin' : get_setting("SLOGIN")})
-	xhtml = response.text
+	xhtml = _request(target)
+
+	if "No quote data found for" in xhtml:
+		raise ScrapeError("%s is not a valid stock ticker" % symbol)
 
 	# Decode
 	parser = HTMLTableParser()
 	parser.feed(xhtml)
 	
-	# TODO: Check if no options available (raise exception or print error, schedule contract reload)
-
 	# Modify list - [strike, bid, ask, odds]
 	tables = parser.tables[6:-5]
-	contracts = [ [ Decimal(tables[i-1][1][0].split(" ")[0]), Decimal(tables[i-1][1][1]), Decimal(tables[i][0][1]), int(tables[i][0][5][:-1]) ] for i in range(1, len(tables)) ]
-	
-	# Grab header with price and change
-	header = tables[0][0][2].split("\n")[-1]
-	start_index = header.find("(")
-	end_index = header.find(",  V")
-	header = header[start_index:end_index]
-	
-	# Grab price
-	price = Decimal(header[header.find("Last:")+6:header.find(" , ")])
+	if len(tables) < 2:
+		raise NoChainError("No %s contracts for %s in %s" % (type, symbol, month))
+
+	try:
+		contracts = [ [ Decimal(tables[i-1][1][0].split(" ")[0]), Decimal(tables[i-1][1][1]), Decimal(tables[i][0][1]), int(tables[i][0][5][:-1]) ] for i in range(1, len(tables)) ]
+		
+		# Grab header with price and change
+		header = tables[0][0][2].split("\n")[-1]
+		start_index = header.find("(")
+		end_index = header.find(",  V")
+		header = header[start_index:end_index]
+		
+		# Grab price
+		price = _header_price(header)
+	except (IndexError, ValueError, ArithmeticError) as e:
+		raise ScrapeError("Could not read %s contracts for %s in %s: %s" % (type, symbol, month, e))
 	
-	_ts_data_cache[key] = (datetime.datetime.now(), header, contracts)
+	cache_contracts(symbol, month, type, header, contracts)
 	
 	return (price, contracts)
 	
@@ -69,25 +131,30 @@ def update_months(symbol, symbol_month):
 	target = "https://www.stockoptionschannel.com/symbol/?symbol=%s" % (symbol.strip("$"))
 					
 	# Request
-	response = requests.get(target, cookies={'slogin' : get_setting("SLOGIN")})
-	xhtml = response.text
+	try:
+		xhtml = _request(target)
+	except LoginRequiredError:
+		print("Set SLOGIN before continuing")
+		return False
 	
 	if "No quote data found for" in xhtml:
 		return False
 		
-	if "You have viewed 6 pages within the last 6 hours." in xhtml:
-		print("Set SLOGIN before continuing")
-		return False
-		
 	# Decode
 	parser = HTMLTableParser()
 	parser.feed(xhtml)
 
 	# Modify list
-	entries = parser.tables[7][1:]
-	dates = [ datetime.datetime.strptime(entry[0], "%B %d, %Y").strftime("%Y%m%d") for entry in entries ]
+	try:
+		entries = parser.tables[7][1:]
+		dates = [ datetime.datetime.strptime(entry[0], "%B %d, %Y").strftime("%Y%m%d") for entry in entries ]
+	except (IndexError, ValueError) as e:
+		raise ScrapeError("Could not read contract months for %s: %s" % (symbol, e))
+	if not dates:
+		raise ScrapeError("No contract months listed for %s" % symbol)
 	
 	symbol_month[symbol] = dates
+	month_timestamps[symbol] = datetime.datetime.now()
 	
 	return True
 
@@ -100,8 +167,7 @@ def get_daily_watchlist():
 	for i in (0, 1):
 		target = watchlist_urlmask % i
 		# Request
-		response = requests.get(target, cookies={'slogin' : get_setting("SLOGIN")})
-		xhtml = response.text
+		xhtml = _request(target)
 
 		# Decode
 		parser = HTMLTableParser()
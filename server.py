@@ -0,0 +1,87 @@
+from client import SOCKET_PATH
+from contextlib import redirect_stdout, redirect_stderr
+from io import StringIO
+from os import path, remove, makedirs
+import socket
+import socketserver
+import sys
+import main
+
+class CommandHandler(socketserver.StreamRequestHandler):
+	"""Runs one command per connection and writes everything it printed back to the client"""
+
+	def handle(self):
+		cmd = self.rfile.readline().decode().strip()
+		if not cmd:
+			return
+
+		# Errors go to stderr with machine readable output, the client should see those too
+		output = StringIO()
+		with redirect_stdout(output), redirect_stderr(output):
+			if cmd == "shutdown":
+				print("shutting down...")
+				self.server.running = False
+			elif cmd == "exit" or cmd == "quit":
+				print("Use 'shutdown' to stop the server")
+			else:
+				try:
+					main.parse(cmd)
+				except Exception as e:
+					# Keep the server alive if a single command fails
+					print("Error running '%s': %s" % (cmd, e))
+				# Save after every command, the server may run for a long time
+				main.save_modified()
+
+		self.wfile.write(output.getvalue().encode())
+
+
+class ServerRunningError(Exception):
+	"""Raised when another server is already listening on the socket"""
+	pass
+
+
+class CommandServer(socketserver.UnixStreamServer):
+	"""Unix socket server holding one warm copy of the lists, months, settings, and caches"""
+
+	def __init__(self, socket_path=SOCKET_PATH):
+		makedirs(path.dirname(socket_path) or ".", exist_ok=True)
+		# Remove a stale socket left over from an unclean exit, but never one a live server is listening on
+		if path.exists(socket_path):
+			with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+				try:
+					s.connect(socket_path)
+				except ConnectionRefusedError:
+					remove(socket_path)
+				else:
+					raise ServerRunningError("A server is already listening on %s" % socket_path)
+		socketserver.UnixStreamServer.__init__(self, socket_path, CommandHandler)
+		self.socket_path = socket_path
+		self.running = True
+
+	def serve(self):
+		try:
+			while self.running:
+				self.handle_request()
+		except KeyboardInterrupt:
+			print("quitting...")
+		finally:
+			self.server_close()
+			remove(self.socket_path)
+			main.save_modified()
+
+
+if __name__ == "__main__":
+	try:
+		server = CommandServer()
+	except ServerRunningError as e:
+		print(e)
+		sys.exit(1)
+
+	main.load_data()
+	main.allow_unbounded = False
+
+	# There is no terminal attached to commands, so confirmations read EOF instead of blocking
+	sys.stdin = StringIO()
+
+	print("Listening on %s" % SOCKET_PATH)
+	server.serve()
@@ -8,6 +8,8 @@ def str_to_bool(str):
 
 _settings = {
 	"DATA_STALE_TIMEOUT" : [5, int, "Data is only valid and cached for this many minutes"],
+	"MONTHS_STALE_TIMEOUT" : [1440, int, "Contract months are refetched after this many minutes"],
+	"DIVIDEND_STALE_TIMEOUT" : [1440, int, "Dividend data is only valid and cached for this many minutes"],
 	"SLOGIN" : ["", str, "Authentication cookie for stockoptionschannel.com"],
 	"MIN_OPTION_RETURN" : [0.03, float, "Minimum percent return for options and option spreads"],
 	"FILTER_PROBABILITY" : [79, int, "Minimum percent of expiring worthless for option spreads to be considered"],
@@ -19,6 +21,14 @@ _settings = {
 	"MAX_CALENDAR_CONTRACTS" : [5, int, "Maximum number of contracts (not necessarily months) to consider for calendar spreads"],
 	"MAX_SPREAD_COLLATERAL" : [500, int, "Maximum collateral to consider a spread"],
 	"MAX_CONTRACT_PRICE" : [800, int, "Maximum amount to spend on a covered call or a put option"],
+	"WATCH_MIN_CHANGE" : [0.1, float, "Minimum relative change in return for watch to report an option or spread as changed"],
+	"OUTPUT_FORMAT" : ["text", str, "Format for reports: text, csv, or jsonl"],
+	"CACHE_MAX_ENTRIES" : [2000, int, "Maximum number of option chains (or other results) kept in each cache"],
+	"CACHE_MAX_MB" : [100, int, "Approximate maximum memory in megabytes for each cache, 0 for no limit"],
+	"REQUEST_TIMEOUT" : [30, int, "Seconds to wait for a response before a request fails"],
+	"MAX_RETRIES" : [3, int, "Number of times to retry requests that failed because of network or server errors"],
+	"RETRY_BACKOFF" : [2, int, "Seconds to wait before retrying failed requests, doubled for each further retry"],
+	"MAX_WORKERS" : [8, int, "Maximum number of concurrent requests when fetching many symbols at once"],
 	}
 
 
@@ -50,7 +60,11 @@ def set_setting(setting, value):
 		
 def is_setting(setting):
 	return setting.upper() in _settings.keys()
-	
+
+def setting_type(setting):
+	"""Returns the function used to convert strings to values of setting"""
+	return _settings[setting.upper()][1]
+
 def print_settings():
 	longest_key = max(map(len, _settings.keys()))
 	longest_val = max(map(len, map(str, map(lambda val: val[0], _settings.values()))))
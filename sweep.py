@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import product
+from os import cpu_count
+from settings import get_setting, setting_type
+
+SWEEP_SETTINGS = ("FILTER_PROBABILITY", "MIN_OPTION_RETURN", "MAX_SPREAD_COLLATERAL", "MAX_CONTRACT_PRICE")
+PARALLEL_THRESHOLD = 50 # Fewer combinations than this are evaluated in this process, avoiding worker startup
+
+# Prepared chains being swept, set in each worker process by _init_worker
+_prepared = []
+_best_only = True
+
+def parse_values(setting, text):
+	"""Parses START:STOP[:STEP] (inclusive, STEP defaults to 1) or comma separated values for setting.
+	Raises ValueError if the values are not valid for the setting."""
+	convert = setting_type(setting)
+	if ":" not in text:
+		return [ convert(v) for v in text.split(",") if v ]
+
+	try:
+		bounds = [ Decimal(v) for v in text.split(":") ]
+	except InvalidOperation:
+		raise ValueError("%s is not a valid range" % text)
+	if len(bounds) == 2:
+		bounds.append(Decimal(1))
+	if len(bounds) != 3 or bounds[2] <= 0:
+		raise ValueError("%s is not a valid range" % text)
+	(start, stop, step) = bounds
+
+	values = []
+	while start <= stop:
+		values.append(convert(str(start)))
+		start += step
+	return values
+
+def prepare(chains):
+	"""Precomputes everything filter_options and credit_spreads work out that does not depend on the swept settings,
+	so that each combination only has to compare returns against thresholds.
+	Returns [(options, spread groups)] with options as [(strike, type, return)] and spread groups as
+	[(short odds, [(return, collateral)] sorted from highest return)], one group for each out of the money short strike."""
+	prepared = []
+	for (symbol, month, type, price, opts) in chains:
+		options = []
+		groups = []
+		for (short, opt) in enumerate(opts):
+			# filter_options, except for the MAX_CONTRACT_PRICE and (for calls) MIN_OPTION_RETURN thresholds
+			if opt[1] != 0:
+				if type == "put" and opt[0] - opt[1] < price:
+					options.append((opt[0], type, opt[1] / opt[0]))
+				elif type == "call":
+					options.append((opt[0], type, (opt[0] - price + opt[1]) / price))
+
+			# credit_spreads, except for the FILTER_PROBABILITY, MIN_OPTION_RETURN and MAX_SPREAD_COLLATERAL thresholds
+			if (type == "call" and opt[0] > price) or (type == "put" and opt[0] < price):
+				low = 0 if type == "put" else short+1
+				high = short if type == "put" else len(opts)
+				pairs = []
+				for long in range(low, high):
+					collateral = abs(opt[0] - opts[long][0])
+					if collateral:
+						pairs.append(((opt[1] - opts[long][2]) / collateral, collateral))
+				# Stable sort, so ties keep the order credit_spreads would see them in
+				pairs.sort(key=lambda pair: pair[0], reverse=True)
+				groups.append((opt[3], pairs))
+		prepared.append((options, groups))
+	return prepared
+
+def _init_worker(prepared, best_only):
+	global _prepared, _best_only
+	_prepared = prepared
+	_best_only = best_only
+
+def evaluate(combination):
+	"""Screens every prepared chain with the settings in combination, with the same results as filter_options and credit_spreads.
+	Returns (options, spreads, best option return, average spread return, best spread return)"""
+	probability = combination["FILTER_PROBABILITY"]
+	min_return = combination["MIN_OPTION_RETURN"]
+	max_collateral = combination["MAX_SPREAD_COLLATERAL"] / 100
+	max_price = combination["MAX_CONTRACT_PRICE"]
+
+	option_returns = []
+	spread_returns = []
+	for (options, groups) in _prepared:
+		for (strike, type, percent_return) in options:
+			if strike * 100 <= max_price and (type == "put" or percent_return >= min_return):
+				option_returns.append(percent_return)
+
+		for (odds, pairs) in groups:
+			if odds <= probability:
+				continue
+			for (spread_return, collateral) in pairs:
+				if spread_return <= min_return:
+					break
+				if not _best_only:
+					spread_returns.append(spread_return)
+				elif collateral <= max_collateral:
+					spread_returns.append(spread_return)
+					break
+
+	return (len(option_returns), len(spread_returns),
+		max(option_returns, default=0),
+		sum(spread_returns) / len(spread_returns) if spread_returns else 0,
+		max(spread_returns, default=0))
+
+def sweep(chains, grid):
+	"""Evaluates every combination of the values in grid ({ setting : [values] }) against chains.
+	Settings not in grid keep their current value. Returns [(combination, results from evaluate)]"""
+	swept = [ setting for setting in SWEEP_SETTINGS if setting in grid ]
+	combinations = []
+	for values in product(*[ grid[setting] for setting in swept ]):
+		combination = { setting : get_setting(setting) for setting in SWEEP_SETTINGS }
+		combination.update(zip(swept, values))
+		combinations.append(combination)
+
+	prepared = prepare(chains)
+	best_only = not get_setting("PRINT_ALL")
+	cpus = cpu_count() or 1 # None if the count cannot be determined
+	if len(combinations) < PARALLEL_THRESHOLD or cpus == 1:
+		_init_worker(prepared, best_only)
+		return list(zip(combinations, map(evaluate, combinations)))
+
+	with ProcessPoolExecutor(initializer=_init_worker, initargs=(prepared, best_only)) as executor:
+		results = executor.map(evaluate, combinations, chunksize=max(1, len(combinations) // (4 * cpus)))
+		return list(zip(combinations, results))
+
+def print_sweep(swept, results):
+	"""Prints one row per combination with the swept settings and the opportunities found"""
+	columns = swept + ["OPTIONS", "SPREADS", "BEST OPT", "AVG SPREAD", "BEST SPREAD"]
+	rows = []
+	for (combination, (options, spreads, best_option, average_spread, best_spread)) in results:
+		rows.append([ str(combination[setting]) for setting in swept ] +
+			[ str(options), str(spreads), "%.1f%%" % (best_option * 100), "%.1f%%" % (average_spread * 100), "%.1f%%" % (best_spread * 100) ])
+
+	widths = [ max([len(column)] + [ len(row[i]) for row in rows ]) for (i, column) in enumerate(columns) ]
+	for row in [columns] + rows:
+		print("  ".join("{0:>{width}}".format(value, width=width) for (value, width) in zip(row, widths)))
@@ -3,6 +3,7 @@ import asyncio
 from decimal import Decimal
 from typing import List, Tuple
 from settings import get_setting
+from scraper import cached_contracts, cache_contracts
 from HTMLTableParser import HTMLTableParser
 
 class TickerList:
@@ -35,6 +36,11 @@ class TickerList:
         Returns (price, [contracts]) where each contract is (strike, bid, ask, odds)
         """
         target = "https://www.stockoptionschannel.com/symbol/?symbol=%s&month=%s&type=%s" % (symbol.strip("$"), month, type)
+
+        # Share the synchronous scraper's cache and expiry policy
+        cached = cached_contracts(symbol, month, type)
+        if cached:
+            return cached
         
         # Asynchronous Request
         if(get_setting("DEBUG")): print(target)
@@ -59,6 +65,8 @@ class TickerList:
         
         # Grab price
         price = Decimal(header[header.find("Last:")+6:header.find(" , ")])
+
+        cache_contracts(symbol, month, type, header, contracts)
         
         return (price, contracts)
 